@@ -10,27 +10,41 @@ les bytes à patcher, accompagnés des offsets calculés.
 Le script désassemble les instructions et identifie les bytes contenant des adresses
 mémoire qui doivent être relocalisées vers une nouvelle base mémoire.
 
+Capstone est utilisé en mode décodage seul (sans détails, via disasm_lite) pour
+connaître la taille des instructions. Les adresses sont ensuite recherchées dans
+les bytes de l'instruction plutôt que via le déplacement du ModR/M, afin de
+couvrir aussi les immédiats 32-bit (ex: mov dword ptr [addr], offset addr).
+
 Usage: python patch_memory_usage.py --csv <file> --binary <file> [options]
 
 Exemple:
     python patch_memory_usage.py --csv ida_usage.csv --binary FF8_EN.exe --memory-base 0x01CF4064
 
-Sortie TOML:
+Sortie TOML (écrite au fil du désassemblage, métadonnées en fin de fichier):
     [instructions]
     "0x0048D774" = {bytes = "8D 86 XX XX XX XX", offset = "0x2A"}
     "0x0048D8A4" = {bytes = "8D 90 XX XX XX XX", offset = "0x2A"}
+
+    [metadata]
+    ...
 """
 
-import csv
 import struct
 import logging
+import mmap
 import os
-import re
 import argparse
-import toml
+import tomli_w
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import takewhile
 from capstone import Cs, CS_ARCH_X86, CS_MODE_32
 
+# Lecture d'un dword little endian (format précompilé)
+_unpack_u32 = struct.Struct('<I').unpack_from
+
 def setup_logging(log_file, verbose):
     """Configure le système de logging"""
     level = logging.DEBUG if verbose else logging.INFO
@@ -44,6 +58,16 @@ def setup_logging(log_file, verbose):
     )
     return logging.getLogger(__name__)
 
+def non_negative_int(value):
+    """Type argparse: entier positif ou nul"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"entier invalide: {value}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"doit être positif ou nul: {value}")
+    return number
+
 def parse_arguments():
     """Parse les arguments de ligne de commande"""
     parser = argparse.ArgumentParser(
@@ -113,79 +137,251 @@ def parse_arguments():
         help="Fichier de sortie TOML (défaut: stdout)"
     )
     
+    parser.add_argument(
+        "--jobs", "-j",
+        type=non_negative_int,
+        default=1,
+        help="Nombre de processus de désassemblage, 0 pour un par CPU (défaut: 1)"
+    )
+    
     return parser.parse_args()
 
-def find_memory_references_in_bytes(instruction_bytes, memory_base, max_range):
+def address_top_byte(memory_base, max_range):
     """
-    Trouve les références mémoire dans les bytes d'instruction et calcule les offsets à patcher
+    Retourne l'octet de poids fort commun à toutes les adresses proches de memory_base
+    
+    Returns:
+        int: Octet de poids fort, ou None si la plage couvre plusieurs valeurs
+    """
+    low = max(memory_base - max_range, 0) >> 24
+    high = min(memory_base + max_range, 0xFFFFFFFF) >> 24
+    return low if low == high else None
+
+def encode_instruction(instruction_bytes, memory_base, max_range, top_byte=None):
+    """
+    Encode les bytes d'une instruction en hexadécimal en marquant avec 'X' les bytes à patcher
+    
+    Les adresses 32-bit proches de memory_base sont recherchées et marquées en une seule
+    passe sur les bytes de l'instruction.
     
     Args:
         instruction_bytes (bytes): Bytes bruts de l'instruction
         memory_base (int): Adresse de base mémoire de référence
         max_range (int): Plage maximale pour considérer un offset comme valide
+        top_byte (int): Octet de poids fort des adresses recherchées (voir address_top_byte)
         
     Returns:
-        list: Liste des offsets à patcher dans les bytes de l'instruction
+        tuple: (chaîne hexadécimale avec 'X' pour les bytes à patcher,
+                offset de la première adresse trouvée ou 0)
     """
-    patch_offsets = []
+    # Chemin rapide: sans l'octet de poids fort d'une adresse (position >= 3 en little
+    # endian), l'instruction ne peut contenir aucune adresse à patcher
+    if top_byte is not None and instruction_bytes.find(top_byte, 3) == -1:
+        return instruction_bytes.hex(' ').upper(), 0
+    
+    # Chaîne hexadécimale modifiable: chaque byte occupe 3 caractères ("AB ")
+    hex_str = bytearray(instruction_bytes.hex(' ').upper(), 'ascii')
+    main_offset = None
+    low, high = memory_base - max_range, memory_base + max_range
     
     # Chercher des adresses 32-bit dans les bytes (little endian)
     for i in range(len(instruction_bytes) - 3):
-        # Extraire un dword (4 bytes) en little endian
-        addr_bytes = instruction_bytes[i:i+4]
-        addr = struct.unpack('<I', addr_bytes)[0]
+        addr = _unpack_u32(instruction_bytes, i)[0]
         
         # Vérifier si cette adresse est dans la plage de memory_base
-        if abs(addr - memory_base) <= max_range:
-            offset_value = addr - memory_base
-            patch_offsets.append({
-                'byte_offset': i,
-                'memory_offset': offset_value,
-                'original_addr': addr
-            })
+        if low <= addr <= high:
+            # Marquer les 4 bytes de l'adresse avec 'X'
+            hex_str[i * 3:(i + 4) * 3 - 1] = b'XX XX XX XX'
+            if main_offset is None:
+                main_offset = addr - memory_base
     
-    return patch_offsets
+    return hex_str.decode('ascii'), main_offset or 0
 
-def create_patched_bytes_string(instruction_bytes, patch_offsets):
+def group_address_runs(addresses, max_gap):
     """
-    Crée une chaîne de bytes avec des 'X' pour marquer les bytes à patcher
+    Regroupe les adresses triées en séquences contiguës
     
     Args:
-        instruction_bytes (bytes): Bytes originaux de l'instruction
-        patch_offsets (list): Liste des offsets à patcher
+        addresses (list): Adresses à regrouper
+        max_gap (int): Écart maximal entre deux adresses d'une même séquence
         
     Returns:
-        str: Chaîne hexadécimale avec 'X' pour les bytes à patcher
+        list: Liste de séquences (listes d'adresses triées)
     """
-    # Convertir les bytes en liste modifiable
-    hex_chars = []
-    for b in instruction_bytes:
-        hex_chars.extend([f"{b:02X}"[0], f"{b:02X}"[1]])
-    
-    # Marquer les bytes à patcher avec 'X'
-    for patch in patch_offsets:
-        start_idx = patch['byte_offset'] * 2
-        # Marquer 4 bytes (8 caractères hex) avec des X
-        for j in range(8):
-            if start_idx + j < len(hex_chars):
-                hex_chars[start_idx + j] = 'X'
-    
-    # Regrouper par bytes (2 caractères)
-    result = []
-    for i in range(0, len(hex_chars), 2):
-        if i + 1 < len(hex_chars):
-            result.append(hex_chars[i] + hex_chars[i + 1])
+    runs = []
+    for addr in sorted(addresses):
+        if runs and addr - runs[-1][-1] <= max_gap:
+            runs[-1].append(addr)
         else:
-            result.append(hex_chars[i] + '0')
+            runs.append([addr])
+    return runs
+
+def disassemble_run(md, binary_data, run, image_base, bytes_to_read):
+    """
+    Désassemble une séquence d'adresses contiguës en un seul appel Capstone
     
-    return ' '.join(result)
+    Le décodage linéaire démarre à la première adresse de la séquence; les adresses
+    qui ne tombent pas sur une frontière d'instruction du flux linéaire sont
+    décodées individuellement.
+    
+    Args:
+        md (Cs): Instance Capstone
+        binary_data (memoryview): Contenu du fichier binaire
+        run (list): Séquence d'adresses triées (toutes dans les limites du binaire)
+        image_base (int): Adresse de base de l'image
+        bytes_to_read (int): Nombre d'octets à lire par instruction
+        
+    Returns:
+        dict: Bytes de l'instruction décodée pour chaque adresse
+    """
+    start_addr, end_addr = run[0], run[-1]
+    # Capstone attend des bytes: une seule copie de la fenêtre par séquence
+    code = bytes(binary_data[start_addr - image_base:end_addr - image_base + bytes_to_read])
+    wanted = set(run)
+    decoded = {}
+    
+    for address, size, _, _ in takewhile(lambda insn: insn[0] <= end_addr,
+                                         md.disasm_lite(code, start_addr)):
+        if address in wanted:
+            start = address - start_addr
+            decoded[address] = code[start:start + size]
+    
+    for addr in wanted.difference(decoded):
+        start = addr - start_addr
+        for address, size, _, _ in md.disasm_lite(code[start:start + bytes_to_read], addr, count=1):
+            decoded[address] = code[start:start + size]
+    
+    return decoded
+
+def prepatch_runs(md, binary_data, image_base, bytes_to_read, memory_base, max_range, runs):
+    """
+    Désassemble et pré-patche une liste de séquences d'adresses
+    
+    Args:
+        md (Cs): Instance Capstone
+        binary_data (memoryview): Contenu du fichier binaire
+        image_base (int): Adresse de base de l'image
+        bytes_to_read (int): Nombre d'octets à lire par instruction
+        memory_base (int): Adresse de base mémoire de référence
+        max_range (int): Plage maximale pour considérer un offset comme valide
+        runs (list): Séquences d'adresses (voir group_address_runs)
+        
+    Returns:
+        tuple: (entrées (adresse, bytes, offset), adresses non désassemblées,
+                erreurs (adresse, message))
+    """
+    entries = []
+    failures = []
+    errors = []
+    top_byte = address_top_byte(memory_base, max_range)
+    
+    for run in runs:
+        try:
+            decoded = disassemble_run(md, binary_data, run, image_base, bytes_to_read)
+        except Exception as e:
+            errors.extend((addr, str(e)) for addr in run)
+            continue
+        
+        for addr in run:
+            # Bytes de l'instruction (longueur réelle)
+            instruction_bytes = decoded.get(addr)
+            if instruction_bytes is None:
+                failures.append(addr)
+                continue
+            
+            try:
+                # Marquer les bytes à patcher et calculer l'offset principal (premier trouvé ou 0)
+                patched_bytes, main_offset = encode_instruction(
+                    instruction_bytes, memory_base, max_range, top_byte
+                )
+                
+                entries.append((
+                    addr,
+                    patched_bytes,
+                    f"0x{main_offset:X}" if main_offset >= 0 else f"-0x{abs(main_offset):X}"
+                ))
+            except Exception as e:
+                errors.append((addr, str(e)))
+    
+    return entries, failures, errors
+
+# État propre à chaque processus de travail, initialisé une seule fois par _init_worker
+_worker_md = None
+_worker_binary = None
+
+def _init_worker(binary_file):
+    """Initialise un processus de travail: instance Capstone et projection du binaire"""
+    global _worker_md, _worker_binary
+    # Capstone n'est pas partageable entre processus: une instance par processus,
+    # réutilisée pour toutes ses tranches d'adresses
+    _worker_md = Cs(CS_ARCH_X86, CS_MODE_32)
+    _worker_md.detail = False
+    _worker_binary = map_binary(binary_file)
+
+def _prepatch_worker_runs(image_base, bytes_to_read, memory_base, max_range, runs):
+    """Point d'entrée des processus de travail (voir _init_worker)"""
+    return prepatch_runs(_worker_md, _worker_binary, image_base, bytes_to_read, memory_base, max_range, runs)
+
+def split_into_chunks(items, count):
+    """Découpe une liste en au plus `count` tranches contiguës de taille équivalente"""
+    size = max(1, -(-len(items) // count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def open_output(output_file, logger):
+    """
+    Ouvre la sortie TOML (fichier UTF-8 ou stdout)
+    
+    Le fichier est écrit dans un fichier temporaire à côté de la cible, qui n'est mis
+    en place que par close_output: un échec en cours de route laisse la cible intacte.
+    """
+    if not output_file:
+        return sys.stdout
+    logger.info(f"Écriture du fichier TOML: {output_file}")
+    try:
+        return tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', delete=False,
+            dir=os.path.dirname(os.path.abspath(output_file)),
+            prefix=os.path.basename(output_file) + '.', suffix='.tmp'
+        )
+    except Exception as e:
+        logger.error(f"Erreur lors de l'écriture du fichier TOML: {e}")
+        sys.exit(1)
+
+def close_output(out, output_file):
+    """Termine la sortie TOML et remplace la cible par le fichier temporaire"""
+    out.flush()
+    if out is not sys.stdout:
+        out.close()
+        os.replace(out.name, output_file)
+
+def discard_output(out):
+    """Supprime le fichier temporaire s'il n'a pas été mis en place"""
+    if out is not sys.stdout:
+        out.close()
+        if os.path.exists(out.name):
+            os.remove(out.name)
+
+def map_binary(binary_file):
+    """
+    Projette le fichier binaire en mémoire en lecture seule
+    
+    Les pages ne sont chargées qu'à la lecture et les tranches de la vue retournée
+    ne copient pas les données.
+    
+    Returns:
+        memoryview: Vue sur le contenu du fichier
+    """
+    with open(binary_file, "rb") as f:
+        # mmap refuse les fichiers vides
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
 
 def load_binary(binary_file, logger):
     """Charge le fichier binaire"""
     logger.info(f"Chargement du fichier binaire: {binary_file}")
     try:
-        with open(binary_file, "rb") as f:
-            binary_data = f.read()
+        binary_data = map_binary(binary_file)
         logger.info(f"Fichier binaire chargé avec succès. Taille: {len(binary_data)} octets")
         return binary_data
     except FileNotFoundError:
@@ -214,20 +410,27 @@ def read_csv_addresses(csv_file, delimiter, logger):
     invalid_addresses = 0
     
     try:
-        with open(csv_file, newline='') as csvfile:
-            reader = csv.reader(csvfile, delimiter=delimiter)
-            for row_num, row in enumerate(reader, 1):
-                if not row or not row[0].strip().startswith("0x"):
-                    logger.debug(f"Ligne {row_num} ignorée (format invalide): {row}")
-                    continue
-                try:
-                    addr = int(row[0], 16)
-                    addresses.append(addr)
+        with open(csv_file, 'rb') as csvfile:
+            lines = csvfile.read().splitlines()
+        
+        # Seule la première colonne est utile: pas besoin de l'analyseur CSV complet
+        separator = delimiter.encode()
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for row_num, line in enumerate(lines, 1):
+            field = line.split(separator, 1)[0].strip().strip(b'"')
+            if not field.startswith(b"0x"):
+                if debug:
+                    logger.debug(f"Ligne {row_num} ignorée (format invalide): {line!r}")
+                continue
+            try:
+                addr = int(field, 16)
+                addresses.append(addr)
+                if debug:
                     logger.debug(f"Adresse ajoutée: 0x{addr:08X}")
-                except ValueError:
-                    invalid_addresses += 1
-                    logger.warning(f"Adresse invalide ligne {row_num}: {row[0]}")
-                    continue
+            except ValueError:
+                invalid_addresses += 1
+                logger.warning(f"Adresse invalide ligne {row_num}: {field.decode(errors='replace')}")
+                continue
         
         logger.info(f"Lecture terminée. {len(addresses)} adresses valides trouvées")
         if invalid_addresses > 0:
@@ -242,83 +445,91 @@ def read_csv_addresses(csv_file, delimiter, logger):
         logger.error(f"Erreur lors de la lecture du CSV: {e}")
         sys.exit(1)
 
-def main():
-    # Parse des arguments
-    args = parse_arguments()
-    
-    # Configuration du logging
-    logger = setup_logging(args.log_file, args.verbose)
-    
-    logger.info("=== Démarrage du script de pré-patching ===")
-    logger.info(f"Fichier CSV: {args.csv}")
-    logger.info(f"Fichier binaire: {args.binary}")
-    logger.info(f"Base d'image: 0x{args.image_base:08X}")
-    logger.info(f"Base mémoire: 0x{args.memory_base:08X}")
-    logger.info(f"Octets à lire par instruction: {args.bytes_to_read}")
-    logger.info(f"Délimiteur CSV: {repr(args.csv_delimiter)}")
-    logger.info(f"Plage d'offset max: 0x{args.max_offset_range:X}")
+def process_binary(args, logger, binary_data, md, addresses, out):
+    """
+    Désassemble les adresses du CSV et écrit les instructions pré-patchées
     
-    # Chargement des composants
-    binary_data = load_binary(args.binary, logger)
-    md = setup_capstone(logger)
-    addresses = read_csv_addresses(args.csv, args.csv_delimiter, logger)
+    Avec --jobs > 1, chaque processus de travail projette le binaire et crée sa propre
+    instance Capstone (voir _init_worker); binary_data et md ne servent qu'en séquentiel.
     
-    # Désassemblage et création du TOML
+    Args:
+        args (Namespace): Arguments de ligne de commande
+        logger (Logger): Logger configuré par setup_logging
+        binary_data (memoryview): Contenu du fichier binaire (voir load_binary)
+        md (Cs): Instance Capstone (voir setup_capstone)
+        addresses (list): Adresses lues depuis le CSV
+        out (TextIO): Sortie TOML ouverte par open_output
+        
+    Returns:
+        int: Nombre de pré-patchings réussis
+    """
+    # Désassemblage et écriture du TOML au fil de l'eau
+    out.write("[instructions]\n")
     logger.info("Début du désassemblage et pré-patching")
-    instructions = {}
+    last_addr = None
     successful_disassemblies = 0
     out_of_range_addresses = 0
     failed_disassemblies = 0
 
-    for i, addr in enumerate(addresses):
-        if i % 100 == 0 and i > 0:
-            logger.info(f"Progression: {i}/{len(addresses)} adresses traitées")
-        
+    # Évite de formater les messages de debug dans les boucles quand ils sont ignorés
+    debug = logger.isEnabledFor(logging.DEBUG)
+    
+    valid_addresses = []
+    for addr in addresses:
         offset = addr - args.image_base
         if offset < 0 or offset + args.bytes_to_read > len(binary_data):
             out_of_range_addresses += 1
-            logger.debug(f"Adresse hors limites: 0x{addr:08X} (offset: {offset})")
+            if debug:
+                logger.debug(f"Adresse hors limites: 0x{addr:08X} (offset: {offset})")
             continue  # Skip out-of-range
-        
-        code = binary_data[offset:offset + args.bytes_to_read]
-        logger.debug(f"Désassemblage à 0x{addr:08X}, offset: {offset}")
-
-        try:
-            insns = list(md.disasm(code, addr, count=1))
-            if not insns:
-                failed_disassemblies += 1
-                logger.debug(f"Échec du désassemblage à 0x{addr:08X}")
-                continue
-            
-            insn = insns[0]
-            
-            # Obtenir les bytes de l'instruction (longueur réelle)
-            instruction_bytes = code[:insn.size]
-            
-            # Trouver les références mémoire à patcher
-            patch_offsets = find_memory_references_in_bytes(
-                instruction_bytes, args.memory_base, args.max_offset_range
+        valid_addresses.append(addr)
+    
+    runs = group_address_runs(valid_addresses, args.bytes_to_read)
+    jobs = args.jobs or os.cpu_count() or 1
+    jobs = min(jobs, len(runs)) or 1
+    # Plusieurs tranches par processus pour équilibrer la charge et suivre la progression
+    chunks = split_into_chunks(runs, jobs * 4 if jobs > 1 else max(1, len(valid_addresses) // 100))
+    prepatch_args = (args.image_base, args.bytes_to_read, args.memory_base, args.max_offset_range)
+    
+    executor = None
+    try:
+        if jobs > 1:
+            logger.info(f"Désassemblage parallèle sur {jobs} processus")
+            executor = ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_worker, initargs=(args.binary,)
             )
+            results = executor.map(
+                partial(_prepatch_worker_runs, *prepatch_args),
+                chunks, chunksize=1
+            )
+        else:
+            results = map(partial(prepatch_runs, md, binary_data, *prepatch_args), chunks)
+        
+        processed = 0
+        for chunk, (entries, failures, errors) in zip(chunks, results):
+            for addr, patched_bytes, offset_str in entries:
+                addr_key = f"0x{addr:08X}"
+                # Les entrées arrivent triées: une adresse dupliquée suit toujours la précédente
+                if addr != last_addr:
+                    out.write(f'"{addr_key}" = {{bytes = "{patched_bytes}", offset = "{offset_str}"}}\n')
+                    last_addr = addr
+                if debug:
+                    logger.debug(f"Pré-patching réussi: {addr_key} bytes={patched_bytes} offset={offset_str}")
             
-            # Créer la chaîne de bytes avec les marqueurs X
-            patched_bytes = create_patched_bytes_string(instruction_bytes, patch_offsets)
-            
-            # Calculer l'offset principal (premier trouvé ou 0)
-            main_offset = patch_offsets[0]['memory_offset'] if patch_offsets else 0
+            if debug:
+                for addr in failures:
+                    logger.debug(f"Échec du désassemblage à 0x{addr:08X}")
             
-            # Ajouter au dictionnaire des instructions
-            addr_key = f"0x{insn.address:08X}"
-            instructions[addr_key] = {
-                "bytes": patched_bytes,
-                "offset": f"0x{main_offset:X}" if main_offset >= 0 else f"-0x{abs(main_offset):X}"
-            }
+            for addr, message in errors:
+                logger.error(f"Erreur lors du désassemblage à 0x{addr:08X}: {message}")
             
-            successful_disassemblies += 1
-            logger.debug(f"Pré-patching réussi: {addr_key} bytes={patched_bytes} offset={instructions[addr_key]['offset']}")
-        
-        except Exception as e:
-            failed_disassemblies += 1
-            logger.error(f"Erreur lors du désassemblage à 0x{addr:08X}: {e}")
+            successful_disassemblies += len(entries)
+            failed_disassemblies += len(failures) + len(errors)
+            processed += sum(len(run) for run in chunk)
+            logger.info(f"Progression: {processed}/{len(valid_addresses)} adresses traitées")
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     # Statistiques finales
     logger.info("=== Statistiques finales ===")
@@ -327,36 +538,57 @@ def main():
     logger.info(f"Adresses hors limites: {out_of_range_addresses}")
     logger.info(f"Échecs de désassemblage: {failed_disassemblies}")
     logger.info(f"Taux de réussite: {(successful_disassemblies / len(addresses) * 100):.2f}%" if addresses else "N/A")
-    logger.info("=== Fin du script ===")
     
-    # Création du dictionnaire TOML final
-    result = {
-        "metadata": {
-            "script_version": "1.0.0",
-            "memory_base": f"0x{args.memory_base:08X}",
-            "image_base": f"0x{args.image_base:08X}",
-            "total_instructions": successful_disassemblies,
-            "description": "Instructions pré-patchées pour ff8_hook"
-        },
-        "instructions": instructions
-    }
+    return successful_disassemblies
+
+def main():
+    # Parse des arguments
+    args = parse_arguments()
+    
+    # Configuration du logging
+    logger = setup_logging(args.log_file, args.verbose)
+    
+    logger.info("=== Démarrage du script de pré-patching ===")
+    logger.info(f"Fichier CSV: {args.csv}")
+    logger.info(f"Fichier binaire: {args.binary}")
+    logger.info(f"Base d'image: 0x{args.image_base:08X}")
+    logger.info(f"Base mémoire: 0x{args.memory_base:08X}")
+    logger.info(f"Octets à lire par instruction: {args.bytes_to_read}")
+    logger.info(f"Délimiteur CSV: {repr(args.csv_delimiter)}")
+    logger.info(f"Plage d'offset max: 0x{args.max_offset_range:X}")
+    
+    # Chargement des composants, avant d'ouvrir la sortie
+    binary_data = load_binary(args.binary, logger)
+    md = setup_capstone(logger)
+    addresses = read_csv_addresses(args.csv, args.csv_delimiter, logger)
     
     # Sortie TOML
-    toml_content = toml.dumps(result)
+    out = open_output(args.output, logger)
+    try:
+        successful_disassemblies = process_binary(args, logger, binary_data, md, addresses, out)
+        
+        # Métadonnées écrites en fin de fichier, une fois le total connu
+        metadata = {
+            "metadata": {
+                "script_version": "1.0.0",
+                "memory_base": f"0x{args.memory_base:08X}",
+                "image_base": f"0x{args.image_base:08X}",
+                "total_instructions": successful_disassemblies,
+                "description": "Instructions pré-patchées pour ff8_hook"
+            }
+        }
+        out.write("\n")
+        out.write(tomli_w.dumps(metadata))
+        close_output(out, args.output)
+    except OSError as e:
+        logger.error(f"Erreur lors de l'écriture du fichier TOML: {e}")
+        sys.exit(1)
+    finally:
+        discard_output(out)
     
     if args.output:
-        # Écrire dans un fichier avec encodage UTF-8 explicite
-        logger.info(f"Écriture du fichier TOML: {args.output}")
-        try:
-            with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(toml_content)
-            logger.info(f"Fichier TOML créé avec succès: {args.output}")
-        except Exception as e:
-            logger.error(f"Erreur lors de l'écriture du fichier TOML: {e}")
-            sys.exit(1)
-    else:
-        # Sortie vers stdout
-        print(toml_content)
+        logger.info(f"Fichier TOML créé avec succès: {args.output}")
+    logger.info("=== Fin du script ===")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file